@@ -35,6 +35,12 @@ except AttributeError:
     # Using pyyaml version < 5, technically unsafe
     FullLoader = yaml.Loader
 YAMLLOADERS = (FullLoader, yaml.SafeLoader)
+if yaml.__with_libyaml__:
+    # pyyaml was built against libyaml, whose parser is many times faster than
+    # the pure python one. Load with it, but keep registering our constructors
+    # on the pure python loaders too so they keep working if used directly.
+    FullLoader = getattr(yaml, 'CFullLoader', yaml.CLoader)
+    YAMLLOADERS += (FullLoader, yaml.CSafeLoader)
 
 # Metaclass black magic to eliminate need for adding yaml_tag lines to classes
 class SerializableMetaclass(yaml.YAMLObjectMetaclass):
@@ -24,13 +24,16 @@ functions.
 """
 import os
 import glob
+import itertools
 import yaml
 import warnings
-from PIL import Image as pilimage
 import xarray as xr
+import h5netcdf
 import numpy as np
 import importlib
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 from holopy.core.io import serialize
 from holopy.core.io.vis import display_image
@@ -41,8 +44,40 @@ from holopy.core.errors import (
     NoMetadata, BadImage, LoadError, NORMALS_DEPRECATION_MESSAGE)
 from holopy.core.holopy_object import FullLoader# compatibility with pyyaml < 5
 
+# pack_attrs output is only strings and plain numbers, so it can be written
+# with the safe dumper, using libyaml's much faster emitter when available.
+# Complex numbers get the same !complex tag as numpy complex values.
+class SafeDumper(getattr(yaml, 'CSafeDumper', yaml.SafeDumper)):
+    pass
+
+def _complex_representer(dumper, data):
+    return serialize.complex_representer(dumper, np.complex128(data))
+SafeDumper.add_representer(complex, _complex_representer)
+
+try:
+    import tifffile
+    _NO_TIFFFILE = False
+except ImportError:
+    _NO_TIFFFILE = True
+
 attr_coords = '_attr_coords'
 tiflist = ['.tif', '.TIF', '.tiff', '.TIFF']
+# number of images load_average reads ahead of the one being accumulated
+READ_AHEAD = 4
+# target number of array elements per hdf5 chunk when saving (2 MB of float64)
+CHUNK_ELEMENTS = 2**18
+# encoding keys of variables read from hdf5 that set compression or chunking
+HDF5_COMPRESSION_KEYS = ('zlib', 'complevel', 'shuffle', 'chunksizes',
+                         'compression', 'compression_opts')
+# hdf5 chunk cache used when loading. The h5py default (1 MB) is smaller than
+# the chunks save() writes, so lazily loaded data would re-read and decompress
+# the same chunk for every slice taken from it.
+H5_CHUNK_CACHE = {'rdcc_nbytes': 64 * 2**20, 'rdcc_nslots': 521,
+                  'rdcc_w0': 0.75}
+# (significant bits, dtype) used to save images at each supported depth;
+# signed outputs keep one bit for the sign
+IMAGE_DEPTHS = {'float': (None, None), 8: (8, 'uint8'), 16: (15, 'int16'),
+                32: (31, 'int32')}
 
 
 def default_extension(inf, defext='.h5'):
@@ -58,10 +93,15 @@ def default_extension(inf, defext='.h5'):
         return inf
 
 
-def get_example_data_path(name):
+@lru_cache(maxsize=None)
+def _example_data_dir():
     path = os.path.abspath(__file__)
-    path = os.path.join(os.path.split(os.path.split(path)[0])[0],
+    return os.path.join(os.path.split(os.path.split(path)[0])[0],
                         'tests', 'exampledata')
+
+
+def get_example_data_path(name):
+    path = _example_data_dir()
     if isinstance(name, str):
         out = os.path.join(path,name)
     else:
@@ -79,14 +119,14 @@ def pack_attrs(a, do_spacing=False):
     if a.name is not None:
         new_attrs['name'] = a.name
     if do_spacing:
-        new_attrs['spacing']=list(get_spacing(a))
+        new_attrs['spacing'] = get_spacing(a).tolist()
 
     for attr, val in a.attrs.items():
         if isinstance(val, xr.DataArray):
             new_attrs[attr_coords][attr] = OrderedDict()
             for dim in val.dims:
                 new_attrs[attr_coords][attr][str(dim)]=val[dim].values
-            new_attrs[attr]=list(ensure_array(val.values))
+            new_attrs[attr] = ensure_array(val.values).tolist()
         else:
             new_attrs[attr_coords][attr]=False
             if val is not None:
@@ -120,6 +160,13 @@ def unpack_attrs(a):
     return new_attrs
 
 
+def _open_hdf5_dataset(filename):
+    manager = xr.backends.CachingFileManager(
+        h5netcdf.File, filename, mode='r',
+        kwargs=dict(H5_CHUNK_CACHE, decode_vlen_strings=True))
+    return xr.open_dataset(xr.backends.H5NetCDFStore(manager, mode='r'))
+
+
 def load(inf, lazy=False):
     """
     Load data or results
@@ -136,7 +183,13 @@ def load(inf, lazy=False):
 
     """
     try:
-        with xr.open_dataset(default_extension(inf), engine='h5netcdf') as ds:
+        ds = _open_hdf5_dataset(default_extension(inf))
+    except (OSError, ValueError):
+        # not an hdf5 file, fall through to the other formats
+        ds = None
+
+    if ds is not None:
+        with ds:
             if '_source_class' in ds.attrs:
                 _source_class = ds.attrs.pop('_source_class')
                 pathtok = _source_class.split('.')
@@ -164,8 +217,6 @@ def load(inf, lazy=False):
                 return ds[data_vars[0]]
             else:
                 return ds
-    except (OSError, ValueError):
-        pass
 
     # attempt to load a yaml file
     try:
@@ -177,8 +228,11 @@ def load(inf, lazy=False):
 
     if os.path.splitext(inf)[1] in tiflist:
         try:
-            with open(inf, 'rb') as imagefile:
-                meta = yaml.safe_load(pilimage.open(imagefile).tag[270][0])
+            # one read gives both the pixels and the metadata in tag 270
+            arr, description = _read_image(inf)
+            if description is None:
+                raise NoMetadata
+            meta = yaml.safe_load(description)
             try:
                 spacing = meta['spacing']
                 assert spacing is not None
@@ -187,8 +241,8 @@ def load(inf, lazy=False):
             else:
                 with warnings.catch_warnings():
                     warnings.simplefilter("ignore")
-                    im = load_image(inf, spacing, name = meta['name'],
-                                    channel='all')
+                    im = _image_from_pixels(arr, inf, spacing,
+                                            name=meta['name'], channel='all')
                 if '_dummy_channel' in meta:
                     dummy_channel = yaml.safe_load(meta['_dummy_channel'])
                     dummy_channel = im.illumination[dummy_channel]
@@ -198,7 +252,7 @@ def load(inf, lazy=False):
                     im = (im-im.min())*(smax-smin)/(im.max()-im.min())+smin
                 im.attrs = unpack_attrs(meta)
                 return im
-        except KeyError or TypeError:
+        except (KeyError, TypeError):
             raise NoMetadata
     else:
         raise NoMetadata
@@ -234,6 +288,9 @@ def load_image(inf, spacing=None, medium_index=None, illum_wavelen=None,
     Returns
     -------
     obj : xarray.DataArray representation of the image with associated metadata
+        Pixel values are float32, which holds integer camera data of up to
+        24 bits exactly and halves memory use compared to float64. Cast the
+        result if you need double precision for further arithmetic.
 
     """
     if normals is not None:
@@ -241,16 +298,22 @@ def load_image(inf, spacing=None, medium_index=None, illum_wavelen=None,
     if name is None:
         name = os.path.splitext(os.path.split(inf)[-1])[0]
 
-    with open(inf,'rb') as pi_raw:
-        pi = pilimage.open(pi_raw)
-        arr = np.asarray(pi).astype('d')
-        try:
-            if isinstance(yaml.safe_load(pi.tag[270][0]), dict):
-                warnings.warn(
-                    "Metadata detected but ignored. Use hp.load to read it.")
-        except (AttributeError, KeyError):
-            pass
+    arr, description = _read_image(inf)
+    if description is not None and isinstance(yaml.safe_load(description), dict):
+        warnings.warn("Metadata detected but ignored. Use hp.load to read it.")
+    return _image_from_pixels(
+        arr, inf, spacing=spacing, medium_index=medium_index,
+        illum_wavelen=illum_wavelen, illum_polarization=illum_polarization,
+        noise_sd=noise_sd, channel=channel, name=name)
+
 
+def _image_from_pixels(arr, inf, spacing=None, medium_index=None,
+                       illum_wavelen=None, illum_polarization=None,
+                       noise_sd=None, channel=None, name=None):
+    """
+    Build the DataArray load_image returns from pixels already read from inf,
+    so callers that also need the image description only open the file once.
+    """
     extra_dims = None
     if channel is None:
         if arr.ndim > 2:
@@ -265,10 +328,10 @@ def load_image(inf, spacing=None, medium_index=None, illum_wavelen=None,
             channel = range(arr.shape[2])
         channel = ensure_array(channel)
         if channel.max() >= arr.shape[2]:
-            raise LoadError(filename,
+            raise LoadError(inf,
                 "The image doesn't have a channel number {0}".format(channel.max()))
         else:
-            arr = arr[:, :, channel].squeeze()
+            arr = np.ascontiguousarray(arr[..., channel].squeeze())
 
             if len(channel) > 1:
                 # multiple channels. increase output dimensionality
@@ -281,6 +344,8 @@ def load_image(inf, spacing=None, medium_index=None, illum_wavelen=None,
                     pol_index = xr.DataArray(channel, dims=illumination, name=illumination)
                     illum_polarization=xr.concat([to_vector(pol) for pol in illum_polarization], pol_index)
 
+    # cast only after channel selection so we never convert unused channels
+    arr = arr.astype(np.float32, copy=False)
     image = data_grid(
         arr, spacing=spacing, medium_index=medium_index,
         illum_wavelen=illum_wavelen, illum_polarization=illum_polarization,
@@ -288,7 +353,71 @@ def load_image(inf, spacing=None, medium_index=None, illum_wavelen=None,
     return image
 
 
-def save(outf, obj):
+def _read_image(inf):
+    """
+    Read the raw pixel values and tiff image description (if any) of an image.
+
+    Tiffs are read with tifffile when it is available, which hands back the
+    pixels in their native dtype without going through a PIL image object.
+    Other formats, and tiffs tifffile can't decode (e.g. LZW or JPEG
+    compressed tiffs without imagecodecs installed), are read through PIL.
+    """
+    if not _NO_TIFFFILE and os.path.splitext(inf)[1] in tiflist:
+        try:
+            with tifffile.TiffFile(inf) as tif:
+                # only the first frame, as PIL gives for multi-frame tiffs
+                page = tif.pages[0]
+                arr = page.asarray()
+                description = page.description or None
+        except (ValueError, tifffile.TiffFileError):
+            pass
+        else:
+            return arr, description
+
+    # PIL is only imported when needed; hdf5 and yaml io never touch it
+    from PIL import Image as pilimage
+    with open(inf, 'rb') as pi_raw:
+        pi = pilimage.open(pi_raw)
+        arr = np.asarray(pi)
+        try:
+            description = pi.tag[270][0]
+        except (AttributeError, KeyError):
+            description = None
+    return arr, description
+
+
+def _read_images_ahead(paths, n_ahead):
+    """
+    Yield _read_image(path) for each of paths in order, reading up to n_ahead
+    files in background threads while the caller works on the current one.
+
+    Image decoding releases the GIL, so this overlaps disk reads with
+    whatever the caller does with each image, while holding at most n_ahead
+    images in memory.
+    """
+    if len(paths) == 0:
+        return
+    paths = iter(paths)
+    with ThreadPoolExecutor(max_workers=n_ahead) as pool:
+        in_flight = deque(pool.submit(_read_image, path)
+                          for path in itertools.islice(paths, n_ahead))
+        while in_flight:
+            result = in_flight.popleft().result()
+            for path in itertools.islice(paths, 1):
+                in_flight.append(pool.submit(_read_image, path))
+            yield result
+
+
+def _select_channels(arr, channel):
+    """
+    Pick colour channel(s) out of raw pixels the same way load_image does.
+    """
+    if channel is None or channel == 'all' or arr.ndim == 2:
+        return arr
+    return arr[..., ensure_array(channel)]
+
+
+def save(outf, obj, compression=4):
     """
     Save a holopy object
 
@@ -302,6 +431,10 @@ def save(outf, obj):
         Location to save the object
     obj : :class:`holopy.core.holopy_object.HoloPyObject`
         The object to save
+    compression : int or None (optional)
+        zlib compression level (0-9) used for data saved as hdf5. Data are
+        written in chunks so compressed files can still be partially read.
+        None writes uncompressed, unchunked data, which is faster to write.
 
     """
     if isinstance(outf, str):
@@ -318,11 +451,39 @@ def save(outf, obj):
             obj.name=os.path.splitext(os.path.split(outf)[-1])[0]
         obj.attrs = pack_attrs(obj)
         ds = obj.to_dataset()
-        ds.to_netcdf(default_extension(outf), engine='h5netcdf')
+        ds.to_netcdf(default_extension(outf), engine='h5netcdf',
+                     encoding=_compressed_encoding(ds, compression))
     else:
         serialize.save(outf, obj)
 
 
+def _chunk_shape(shape, max_elements=CHUNK_ELEMENTS):
+    # fill chunks from the fastest varying dimension outwards
+    chunks = []
+    for n in reversed(shape):
+        chunk = max(1, min(n, max_elements))
+        chunks.append(chunk)
+        max_elements //= chunk
+    return tuple(reversed(chunks))
+
+
+def _compressed_encoding(ds, compression):
+    if compression is None:
+        # data loaded from a compressed file carries its compression and
+        # chunking in .encoding, which would otherwise be written again
+        for var in ds.variables.values():
+            var.encoding = {key: val for key, val in var.encoding.items()
+                            if key not in HDF5_COMPRESSION_KEYS}
+        return {}
+    encoding = {}
+    for name, var in ds.data_vars.items():
+        if var.ndim > 0 and var.dtype.kind in 'biufc':
+            encoding[name] = {'zlib': True, 'complevel': compression,
+                              'shuffle': True,
+                              'chunksizes': _chunk_shape(var.shape)}
+    return encoding
+
+
 def save_image(filename, im, scaling='auto', depth=8):
     """Save an ndarray or image as a tiff.
 
@@ -411,25 +572,24 @@ def _save_im(filename, im, depth=8):
         from PIL.TiffImagePlugin import ImageFileDirectory_v2 as ifd2
         tiffinfo = ifd2()
         # place metadata in the 'imagedescription' field of the tiff metadata
-        tiffinfo[270] = yaml.dump(metadat, default_flow_style=True)
+        tiffinfo[270] = yaml.dump(metadat, Dumper=SafeDumper,
+                                  default_flow_style=True)
 
     im = im.values
     if im.ndim > 2: im = im[0]
 
-    if depth != 'float':
-        if depth == 8:
-            depth = 8
-            typestr = 'uint8'
-        elif depth == 16 or depth == 32:
-            depth = depth-1
-            typestr = 'int' + str(depth)
-        else:
-            raise Error("Unknown image depth")
+    if depth not in IMAGE_DEPTHS:
+        raise ValueError("Unknown image depth: {}".format(depth))
+    bits, typestr = IMAGE_DEPTHS[depth]
 
+    if typestr is not None:
         if im.max() <= 1:
-            im = im * ((2**depth)-1) + .499999
-            im = im.astype(typestr)
+            # round while writing straight into the integer output array
+            scaled = np.multiply(im, (2**bits)-1)
+            im = np.empty(scaled.shape, dtype=typestr)
+            np.add(scaled, .499999, out=im, casting='unsafe')
 
+    from PIL import Image as pilimage
     if metadat:
         pilimage.fromarray(im).save(filename, tiffinfo=tiffinfo)
     else:
@@ -468,7 +628,7 @@ def load_average(
     Returns
     -------
     averaged_image : xarray.DataArray
-        Image which is an average of images
+        Image which is an average of images, as float32 (like load_image)
         noise_sd attribute contains average pixel stdev normalized by
         total image intensity
     """
@@ -499,11 +659,30 @@ def load_average(
     if np.isscalar(spacing):
         spacing = np.repeat(spacing, 2)
 
-    # calculate the average
-    accumulator = Accumulator()
-    for path in filepath:
-        accumulator.push(load_image(path, spacing, channel=channel))
-    mean_image = accumulator.mean()
+    # calculate the average. Only the first image is turned into a DataArray
+    # to get the coordinates; the rest are accumulated as plain arrays.
+    images = _read_images_ahead(filepath, READ_AHEAD)
+    raw, _ = next(images)
+    name = os.path.splitext(os.path.split(filepath[0])[-1])[0]
+    first_image = _image_from_pixels(raw, filepath[0], spacing,
+                                     channel=channel, name=name)
+    pixels = _select_channels(raw, channel)
+    if _is_small_int(pixels):
+        accumulator = IntegerAccumulator()
+    else:
+        accumulator = Accumulator()
+        pixels = pixels.astype(np.float32)
+    accumulator.push(pixels.reshape(first_image.shape))
+    for raw, _ in images:
+        pixels = _select_channels(raw, channel)
+        if not _is_small_int(pixels):
+            # exact integer sums only hold while every image is 8 or 16 bit
+            if isinstance(accumulator, IntegerAccumulator):
+                accumulator = accumulator.to_float()
+            pixels = pixels.astype(np.float32)
+        accumulator.push(pixels.reshape(first_image.shape))
+    mean_image = first_image.copy(
+        data=np.asarray(accumulator.mean(), dtype=np.float32))
 
     # calculate average noise from image
     if noise_sd is None and len(filepath) > 1:
@@ -531,6 +710,10 @@ def load_average(
     return update_metadata(mean_image, medium_index, illum_wavelen, illum_polarization, normals, noise_sd)
 
 
+def _is_small_int(pixels):
+    return pixels.dtype.kind in 'ui' and pixels.dtype.itemsize <= 2
+
+
 class Accumulator:
     """Calculates average and coefficient of variance for numerical data in
     one pass using Welford's algorithim.
@@ -547,9 +730,9 @@ class Accumulator:
             self._running_var = x * 0.0
             self._running_mean = self._running_var + x
         else:
-            self._running_var += ((x - self._running_mean) *
-             ((x - (self._running_mean + (x - self._running_mean) / self._n))))
-            self._running_mean += (x - self._running_mean) / self._n
+            delta = x - self._running_mean
+            self._running_mean += delta / self._n
+            self._running_var += delta * (x - self._running_mean)
 
     def mean(self):
         return self._running_mean if self._running_mean is not None else 0.0
@@ -571,3 +754,42 @@ class Accumulator:
             return None
         else:
             return np.sqrt(self._running_var / (self._n))
+
+
+class IntegerAccumulator(Accumulator):
+    """Accumulator for 8 or 16 bit integer data that keeps exact integer sums
+    of the data and its square, so no rounding error builds up over many
+    images. The sums are int64, which cannot overflow for fewer than 2**31
+    16 bit images.
+    """
+    def push(self, x):
+        self._n += 1
+        x = np.asarray(x, dtype=np.int64)
+        if self._n == 1:
+            self._sum = x.copy()
+            self._sum_sq = x * x
+        else:
+            self._sum += x
+            self._sum_sq += x * x
+
+    def mean(self):
+        return self._sum / self._n if self._n > 0 else 0.0
+
+    def to_float(self):
+        """Welford Accumulator holding the same data, for continuing with
+        data that is not 8 or 16 bit integer.
+        """
+        accumulator = Accumulator()
+        if self._n > 0:
+            accumulator._n = self._n
+            accumulator._running_mean = self.mean()
+            accumulator._running_var = (self._sum_sq -
+                                        self._sum * accumulator._running_mean)
+        return accumulator
+
+    def _std(self):
+        if self._n == 0:
+            return None
+        else:
+            var = (self._sum_sq - self._sum * self.mean()) / self._n
+            return np.sqrt(np.maximum(var, 0))
@@ -225,7 +225,7 @@ def display_image(im, scaling='auto', vert_axis='x', horiz_axis='y',
                     depth_axis='z', colour_axis='illumination'):
     im = im.copy()
     if isinstance(im, xr.DataArray):
-        if hasattr(im, 'z') and len(im['z']) == 1 and depth_axis is not 'z':
+        if hasattr(im, 'z') and len(im['z']) == 1 and depth_axis != 'z':
             im = im[{'z':0}]
         if depth_axis == 'z' and 'z' not in im.dims:
             im = im.expand_dims('z')
@@ -263,12 +263,16 @@ def display_image(im, scaling='auto', vert_axis='x', horiz_axis='y',
     if np.iscomplex(im).any():
         warn("Image contains complex values. Taking image magnitude.")
         im = np.abs(im)
-    if scaling is 'auto':
+    if isinstance(scaling, str) and scaling == 'auto':
         scaling = (ensure_scalar(im.min()), ensure_scalar(im.max()))
     if scaling is not None:
-        im = np.maximum(im, scaling[0])
-        im = np.minimum(im, scaling[1])
-        im = (im-scaling[0])/(scaling[1]-scaling[0])
+        # clip into a fresh array, then rescale that in place
+        values = np.clip(im.values, scaling[0], scaling[1])
+        if not np.issubdtype(values.dtype, np.inexact):
+            values = values.astype(float)
+        values -= scaling[0]
+        values /= scaling[1] - scaling[0]
+        im = im.copy(deep=False, data=values)
     im.attrs = attrs
     im.attrs['_image_scaling'] = scaling
 
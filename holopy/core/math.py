@@ -16,6 +16,8 @@
 # You should have received a copy of the GNU General Public License
 # along with HoloPy.  If not, see <http://www.gnu.org/licenses/>.
 
+from functools import lru_cache
+
 import numpy as np
 from numpy import sin, cos, arccos, arctan2, sqrt, pi
 from holopy.core.utils import repeat_sing_dims
@@ -41,9 +43,8 @@ def rotate_points(points, theta, phi, psi):
     """
     points = np.array(points)
     rot = rotation_matrix(theta, phi, psi)
-    if points.ndim == 1:
-        return np.dot(rot, points)
-    return np.array([np.dot(rot, c) for c in points])
+    # rotates a single point or every row of points in one product
+    return np.dot(points, rot.T)
 
 
 def rotation_matrix(alpha, beta, gamma, radians = True):
@@ -79,6 +80,13 @@ def rotation_matrix(alpha, beta, gamma, radians = True):
         beta *= pi/180.
         gamma *= pi/180.
 
+    # a fresh array every call, so callers are free to modify it
+    return np.array(_rotation_matrix_elements(
+        float(alpha), float(beta), float(gamma))).reshape((3,3))
+
+
+@lru_cache(maxsize=1024)
+def _rotation_matrix_elements(alpha, beta, gamma):
     ca = cos(alpha)
     sa = sin(alpha)
     cb = cos(beta)
@@ -86,56 +94,98 @@ def rotation_matrix(alpha, beta, gamma, radians = True):
     cg = cos(gamma)
     sg = sin(gamma)
 
-    return np.array([ca*cb*cg - sa*sg, -sa*cb*cg - ca*sg, sb*cg,
-                     ca*cb*sg + sa*cg, -sa*cb*sg + ca*cg, sb*sg,
-                     -ca*sb, sa*sb, cb]).reshape((3,3)) # row major
+    return (ca*cb*cg - sa*sg, -sa*cb*cg - ca*sg, sb*cg,
+            ca*cb*sg + sa*cg, -sa*cb*sg + ca*cg, sb*sg,
+            -ca*sb, sa*sb, cb) # row major
 
 
-def transform_cartesian_to_spherical(x_y_z):
-    x, y, z = x_y_z
-    r = np.linalg.norm(x_y_z, axis=0)
-    theta = np.arctan2(np.sqrt(x**2 + y**2), z)
-    phi = np.arctan2(y, x) % (2*np.pi)
-    return np.array([r, theta, phi])
+def _azimuth(y, x):
+    """The angle arctan2(y, x), wrapped into [0, 2 pi)."""
+    phi = np.arctan2(y, x)
+    if not isinstance(phi, np.ndarray):
+        return phi % (2*np.pi)
+    # arctan2 is in [-pi, pi], so only negative angles need moving. Shifting
+    # those in place is cheaper than a floating point modulo of every angle.
+    np.add(phi, 2*np.pi, out=phi, where=phi < 0)
+    return phi
 
 
-def transform_spherical_to_cartesian(r_theta_phi):
-    r, theta, phi = r_theta_phi
-    x = r * np.cos(phi) * np.sin(theta)
-    y = r * np.sin(phi) * np.sin(theta)
+# The transformations below work on separate coordinate components, e.g.
+# _cartesian_to_spherical(x, y, z) -> (r, theta, phi), so callers that already
+# hold the components avoid stacking them into a (3, N) array and unpacking
+# them again. The public transform_* functions take and return stacked arrays.
+
+def _cartesian_to_spherical(x, y, z):
+    rho_squared = x * x + y * y
+    r = np.sqrt(rho_squared + z * z)
+    theta = np.arctan2(np.sqrt(rho_squared), z)
+    phi = _azimuth(y, x)
+    return r, theta, phi
+
+
+def _spherical_to_cartesian(r, theta, phi):
+    r_sin_theta = r * np.sin(theta)
+    x = r_sin_theta * np.cos(phi)
+    y = r_sin_theta * np.sin(phi)
     z = r * np.cos(theta)
-    return np.array([x, y, z])
+    return x, y, z
 
 
-def transform_cartesian_to_cylindrical(x_y_z):
-    x, y, z = x_y_z
-    rho = np.sqrt(x**2 + y**2)
-    phi = np.arctan2(y, x) % (2*np.pi)
-    return np.array([rho, phi, z])
+def _cartesian_to_cylindrical(x, y, z):
+    rho = np.sqrt(x * x + y * y)
+    phi = _azimuth(y, x)
+    return rho, phi, z
 
 
-def transform_cylindrical_to_cartesian(rho_phi_z):
-    rho, phi, z = rho_phi_z
+def _cylindrical_to_cartesian(rho, phi, z):
     x = rho * np.cos(phi)
     y = rho * np.sin(phi)
-    return np.array([x, y, z])
+    return x, y, z
 
 
-def transform_cylindrical_to_spherical(rho_phi_z):
-    rho, phi, z = rho_phi_z
-    r = np.sqrt(rho**2 + z**2)
+def _cylindrical_to_spherical(rho, phi, z):
+    r = np.sqrt(rho * rho + z * z)
     theta = np.arctan2(rho, z)
-    return np.array([r, theta, phi])
+    return r, theta, phi
 
 
-def transform_spherical_to_cylindrical(r_theta_phi):
-    r, theta, phi = r_theta_phi
+def _spherical_to_cylindrical(r, theta, phi):
     rho = r * np.sin(theta)
     z = r * np.cos(theta)
-    return np.array([rho, phi, z])
+    return rho, phi, z
+
+
+def _stack_coordinates(coords):
+    # components can differ in shape, e.g. a scalar z for detector points all
+    # at one distance, so broadcast them to a common shape before stacking
+    return np.array(np.broadcast_arrays(*coords))
+
+
+def transform_cartesian_to_spherical(x_y_z):
+    return _stack_coordinates(_cartesian_to_spherical(*x_y_z))
+
+
+def transform_spherical_to_cartesian(r_theta_phi):
+    return _stack_coordinates(_spherical_to_cartesian(*r_theta_phi))
+
+
+def transform_cartesian_to_cylindrical(x_y_z):
+    return _stack_coordinates(_cartesian_to_cylindrical(*x_y_z))
+
+
+def transform_cylindrical_to_cartesian(rho_phi_z):
+    return _stack_coordinates(_cylindrical_to_cartesian(*rho_phi_z))
+
+
+def transform_cylindrical_to_spherical(rho_phi_z):
+    return _stack_coordinates(_cylindrical_to_spherical(*rho_phi_z))
+
+
+def transform_spherical_to_cylindrical(r_theta_phi):
+    return _stack_coordinates(_spherical_to_cylindrical(*r_theta_phi))
 
 
-def keep_in_same_coordinates(coords): return np.array(coords)
+def keep_in_same_coordinates(coords): return _stack_coordinates(coords)
 
 
 _transformation_lut = {
@@ -185,9 +235,9 @@ def cartesian_distance(p1, p2=[0,0,0]):
         Cartesian distance between points p1 and p2
 
     """
-    p1 = np.array(p1)
-    p2 = np.array(p2)
-    return np.sqrt(np.sum((p1-p2)**2))
+    separation = (np.asarray(p1) - np.asarray(p2)).ravel()
+    # the dot product sums the squares without a squared temporary
+    return np.sqrt(np.dot(separation, separation))
 
 
 def chisq(fit, data):
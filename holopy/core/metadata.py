@@ -220,8 +220,8 @@ def update_metadata(a, medium_index=None, illum_wavelen=None,
 
 def get_spacing(detector_grid):
     """Find the (x, y) spacing for a ```detector_grid```."""
-    xspacing = np.diff(detector_grid.x)
-    yspacing = np.diff(detector_grid.y)
+    xspacing = np.diff(detector_grid.x.values)
+    yspacing = np.diff(detector_grid.y.values)
     if not (np.allclose(xspacing[0], xspacing) and
             np.allclose(yspacing[0], yspacing)):
         msg = "array has nonuniform spacing, can't determine a single spacing"
@@ -35,9 +35,9 @@ import holopy as hp
 from holopy.core import load, save, load_image, save_image, save_images
 from holopy.core.errors import NoMetadata
 from holopy.core.io import load_average, get_example_data_path
-from holopy.core.io.io import Accumulator
+from holopy.core.io.io import Accumulator, IntegerAccumulator
 from holopy.core.process import normalize
-from holopy.core.metadata import get_spacing, copy_metadata
+from holopy.core.metadata import get_spacing, copy_metadata, update_metadata
 from holopy.core.holopy_object import HoloPyObject
 from holopy.core.tests.common import (
     assert_obj_close, assert_read_matches_write, get_example_data)
@@ -124,6 +124,13 @@ class TestLoadingAndSaving(unittest.TestCase):
         l = self.load_image_with_metadata(filename)
         assert_obj_close(l, self.holo)
 
+    @attr("fast")
+    def test_specify_scaling_as_array(self):
+        filename = os.path.join(self.tempdir, 'image0001.tif')
+        save_image(filename, self.holo, scaling=np.array([0, 255]))
+        l = self.load_image_with_metadata(filename)
+        assert_obj_close(l, self.holo)
+
     @attr("fast")
     def test_auto_scaling(self):
         filename = os.path.join(self.tempdir, 'image0001.tif')
@@ -143,6 +150,21 @@ class TestLoadingAndSaving(unittest.TestCase):
         l = self.load_image_with_metadata(filename + '.tif')
         assert_obj_close(l, self.holo)
 
+    @attr("fast")
+    def test_saving_scaled_16_bit(self):
+        filename = os.path.join(self.tempdir, 'image0004.tif')
+        save_image(filename, self.holo, depth=16)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            l = load_image(filename, spacing=get_spacing(self.holo))
+        assert_equal(l.values.max(), 2**15 - 1)
+
+    @attr("fast")
+    def test_saving_unknown_depth(self):
+        filename = os.path.join(self.tempdir, 'image0005.tif')
+        self.assertRaises(ValueError, save_image, filename, self.holo,
+                          depth=12)
+
     @attr("fast")
     def test_save_load_h5(self):
         filename = os.path.join(self.tempdir, 'image0001')
@@ -150,6 +172,64 @@ class TestLoadingAndSaving(unittest.TestCase):
         loaded = load(filename)
         assert_obj_close(loaded, self.holo)
 
+    @attr("fast")
+    def test_save_load_h5_uncompressed(self):
+        filename = os.path.join(self.tempdir, 'image0001')
+        save(filename, self.holo, compression=None)
+        loaded = load(filename)
+        assert_obj_close(loaded, self.holo)
+
+    @attr("fast")
+    def test_uncompressed_save_of_loaded_h5(self):
+        compressed = os.path.join(self.tempdir, 'compressed')
+        uncompressed = os.path.join(self.tempdir, 'uncompressed')
+        save(compressed, self.holo)
+        save(uncompressed, load(compressed), compression=None)
+        loaded = load(uncompressed)
+        self.assertFalse(loaded.encoding.get('zlib', False))
+        self.assertIsNone(loaded.encoding.get('chunksizes'))
+        assert_obj_close(loaded, self.holo)
+
+    @attr("fast")
+    def test_save_load_colour_h5(self):
+        filename = os.path.join(self.tempdir, 'colour')
+        colour = load_image(get_example_data_path('2colourbg0.jpg'),
+                            spacing=1, channel=[0, 1])
+        save(filename, colour)
+        loaded = load(filename)
+        self.assertEqual(loaded.illumination.values.tolist(),
+                         ['red', 'green'])
+        assert_equal(loaded.sel(illumination='red').values,
+                     colour.sel(illumination='red').values)
+
+    @attr("fast")
+    def test_multi_frame_tif_loads_first_frame(self):
+        filename = os.path.join(self.tempdir, 'frames.tif')
+        frames = [pilimage.fromarray(np.full((4, 5), i, dtype=np.uint8))
+                  for i in range(1, 4)]
+        frames[0].save(filename, save_all=True, append_images=frames[1:])
+        loaded = load_image(filename, spacing=1)
+        self.assertEqual(loaded.shape, (1, 4, 5))
+        assert_equal(loaded.values, 1)
+
+    @attr("fast")
+    def test_load_lzw_compressed_tif(self):
+        filename = os.path.join(self.tempdir, 'lzw.tif')
+        pixels = np.arange(20, dtype=np.uint8).reshape(4, 5)
+        pilimage.fromarray(pixels).save(filename, compression='tiff_lzw')
+        loaded = load_image(filename, spacing=1)
+        assert_equal(loaded.values[0], pixels)
+
+    @attr("fast")
+    def test_save_image_with_complex_metadata(self):
+        filename = os.path.join(self.tempdir, 'complex.tif')
+        holo = update_metadata(self.holo,
+                               illum_polarization=np.array([1+0j, 0j]))
+        save_image(filename, holo, scaling=None)
+        loaded = load(filename)
+        assert_equal(loaded.illum_polarization.values,
+                     holo.illum_polarization.values)
+
     @attr("fast")
     def test_load_func_from_save_image_func(self):
         filename = os.path.join(self.tempdir, 'image0006')
@@ -192,6 +272,12 @@ class TestLoadingAndSaving(unittest.TestCase):
             ValueError, "`normals` are deprecated*",
             load_image, filename, normals=np.array([0, 0, 1.]))
 
+    @attr('fast')
+    def test_load_image_is_float32(self):
+        filename = get_example_data_path('image01.jpg')
+        loaded = load_image(filename, **IMAGE01_METADATA)
+        self.assertEqual(loaded.dtype, np.float32)
+
     @attr('fast')
     def test_load_average_normals_raises_error_with_deprecation_message(self):
         filename = 'error-should-raise-regardless-of-filename.tiff'
@@ -312,6 +398,19 @@ class TestAccumulator(unittest.TestCase):
         accumulator = Accumulator()
         self.assertTrue(accumulator.cv() is None)
 
+    @attr("fast")
+    def test_integer_accumulator_matches_float(self):
+        data = np.random.RandomState(5).randint(0, 2**16, (6, 4, 3),
+                                                dtype=np.uint16)
+        exact = IntegerAccumulator()
+        approximate = Accumulator()
+        for frame in data:
+            exact.push(frame)
+            approximate.push(frame.astype(float))
+        assert_allclose(exact.mean(), data.mean(axis=0))
+        assert_allclose(exact._std(), data.std(axis=0))
+        assert_allclose(exact.cv(), approximate.cv())
+
     @attr("medium")
     def test_calculate_hologram_noise_sd(self):
         accumulator = Accumulator()
@@ -331,6 +430,40 @@ class TestAccumulator(unittest.TestCase):
                  for colour in ['green', 'red']]
         self.assertTrue(np.allclose(gold_noise, noise))
 
+    @attr('fast')
+    def test_load_average_reading_ahead_matches_mean(self):
+        # more files than are read ahead at once, with repeats
+        names = ['bg01.jpg', 'bg02.jpg', 'bg03.jpg'] * 3
+        paths = get_example_data_path(names)
+        bg = load_average(paths, spacing=IMAGE01_METADATA['spacing'])
+        images = [load_image(path, spacing=IMAGE01_METADATA['spacing'])
+                  for path in paths]
+        numpy_mean = np.mean([image.values for image in images], axis=0)
+        assert_allclose(bg.values, numpy_mean, rtol=1e-6)
+
+    @attr('fast')
+    def test_load_average_named_after_first_file(self):
+        paths = get_example_data_path(['bg01.jpg', 'bg02.jpg'])
+        bg = load_average(paths, spacing=IMAGE01_METADATA['spacing'])
+        self.assertEqual(bg.name, 'bg01')
+
+    @attr('fast')
+    def test_load_average_of_integer_then_float_images(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            paths = [os.path.join(tempdir, 'frame{}.tif'.format(i))
+                     for i in range(3)]
+            frames = [np.full((4, 5), 1, dtype=np.uint8),
+                      np.full((4, 5), 2.5, dtype=np.float32),
+                      np.full((4, 5), 4, dtype=np.uint8)]
+            for path, frame in zip(paths, frames):
+                pilimage.fromarray(frame).save(path)
+            bg = load_average(paths, spacing=1)
+            assert_allclose(bg.values, 2.5)
+            assert_allclose(bg.noise_sd, np.std([1, 2.5, 4]) / 2.5)
+        finally:
+            shutil.rmtree(tempdir)
+
 
 def _load_raw_example_data():
     imagepath = get_example_data_path('image01.jpg')
@@ -17,6 +17,7 @@
 # along with HoloPy.  If not, see <http://www.gnu.org/licenses/>.
 
 from copy import copy
+from numbers import Number
 import warnings
 
 import yaml
@@ -24,7 +25,7 @@ import numpy as np
 import xarray as xr
 
 from holopy.core.metadata import dict_to_array, make_subset_data
-from holopy.core.utils import ensure_array, ensure_listlike, ensure_scalar
+from holopy.core.utils import ensure_array, ensure_listlike
 from holopy.core.holopy_object import HoloPyObject
 from holopy.scattering.errors import (MultisphereFailure, TmatrixFailure,
                                       InvalidScatterer, MissingParameter)
@@ -66,6 +67,27 @@ def make_xarray(dim_name, keys, values):
         return xr.DataArray(np.array(values), coords=[keys], dims=dim_name)
 
 
+class _XarrayTemplate:
+    """
+    Stands in for make_xarray in compiled maps when dim_name and keys are
+    constant. Arrays of numbers are packed by copying a template with the
+    right coords, which skips xarray's coordinate checks.
+    """
+    def __init__(self, dim_name, keys):
+        self.dim_name = dim_name
+        self.keys = keys
+        self.template = xr.DataArray(np.zeros(len(keys)), coords=[keys],
+                                     dims=dim_name)
+
+    def __call__(self, values):
+        if len(values) == 0 or isinstance(values[0], xr.DataArray):
+            return make_xarray(self.dim_name, self.keys, values)
+        data = np.array(values)
+        if data.shape != self.template.shape:
+            return make_xarray(self.dim_name, self.keys, values)
+        return self.template.copy(deep=False, data=data)
+
+
 def make_complex(real, imag):
     if isinstance(real, Prior) or isinstance(imag, Prior):
         return ComplexPrior(real, imag)
@@ -73,6 +95,40 @@ def make_complex(real, imag):
         return complex(real, imag)
 
 
+class _ParamRef(str):
+    '''
+    Placeholder for a parameter in a map. It is the '_parameter_<index>'
+    string that maps have always used, so maps compare and save as before,
+    but it also carries the index so it does not have to be parsed back.
+    '''
+    def __new__(cls, index):
+        ref = super().__new__(cls, '_parameter_{}'.format(index))
+        ref.index = index
+        return ref
+
+    def __getnewargs__(self):
+        return (self.index,)
+
+
+def _param_ref_representer(dumper, data):
+    return dumper.represent_str(str(data))
+yaml.add_representer(_ParamRef, _param_ref_representer)
+
+
+def _parameter_index(map_entry):
+    '''
+    Index of the parameter map_entry stands for, or None if it is not a
+    placeholder. Plain '_parameter_<index>' strings from maps loaded from
+    yaml are also recognised.
+    '''
+    if type(map_entry) is _ParamRef:
+        return map_entry.index
+    elif isinstance(map_entry, str) and map_entry[:11] == '_parameter_':
+        return int(map_entry[11:])
+    else:
+        return None
+
+
 def read_map(map_entry, parameter_values):
     '''
     Reads a map to create an object
@@ -84,7 +140,9 @@ def read_map(map_entry, parameter_values):
     parameter_values: listlike
         values to replace map placeholders in final object
     '''
-    if isinstance(map_entry, str) and map_entry[:11] == '_parameter_':
+    if type(map_entry) is _ParamRef:
+        return parameter_values[map_entry.index]
+    elif isinstance(map_entry, str) and map_entry[:11] == '_parameter_':
         return parameter_values[int(map_entry[11:])]
     elif isinstance(map_entry, list):
         if len(map_entry) == 2 and callable(map_entry[0]):
@@ -96,6 +154,137 @@ def read_map(map_entry, parameter_values):
         return map_entry
 
 
+# tags for the nodes of a compiled map, see compile_map
+_CONSTANT, _PARAMETER, _CALL, _LIST, _DICT = range(5)
+
+
+def compile_map(map_entry):
+    '''
+    Compiles a map into a plan that read_plan can evaluate quickly
+
+    Placeholders are parsed once here rather than on every read, and
+    subtrees without parameters that evaluate to immutable values are
+    computed once.
+
+    Parameters
+    ----------
+    map_entry:
+        map or subset of map created by model methods
+
+    Returns
+    -------
+    plan: tuple
+        (tag, payload) node, with child plans nested in the payload
+    '''
+    index = _parameter_index(map_entry)
+    if index is not None:
+        return (_PARAMETER, index)
+    elif isinstance(map_entry, list):
+        if len(map_entry) == 2 and callable(map_entry[0]):
+            func, args = map_entry
+            if func is dict:
+                keys = tuple(key for key, val in args[0])
+                values = [compile_map(val) for key, val in args[0]]
+                return (_DICT, (keys, values))
+            args = [compile_map(arg) for arg in args]
+            if func is make_xarray and not any(
+                    _plan_has_parameters(arg) for arg in args[:2]):
+                func = _XarrayTemplate(*[read_plan(arg, [])
+                                         for arg in args[:2]])
+                args = args[2:]
+            if all(tag == _CONSTANT for tag, payload in args):
+                value = func(*[payload for tag, payload in args])
+                if isinstance(value, (Number, str)):
+                    return (_CONSTANT, value)
+            return (_CALL, (func, args))
+        else:
+            return (_LIST, [compile_map(item) for item in map_entry])
+    else:
+        return (_CONSTANT, map_entry)
+
+
+def read_plan(plan, parameter_values):
+    '''
+    Reads a plan made by compile_map to create an object
+
+    Gives the same result as calling read_map on the uncompiled map.
+
+    Parameters
+    ----------
+    plan: tuple
+        compiled map
+    parameter_values: listlike
+        values to replace map placeholders in final object
+    '''
+    tag, payload = plan
+    if tag == _PARAMETER:
+        return parameter_values[payload]
+    elif tag == _DICT:
+        keys, values = payload
+        return dict(zip(keys, [read_plan(val, parameter_values)
+                               for val in values]))
+    elif tag == _CALL:
+        func, args = payload
+        return func(*[read_plan(arg, parameter_values) for arg in args])
+    elif tag == _LIST:
+        return [read_plan(item, parameter_values) for item in payload]
+    else:
+        return payload
+
+
+def plan_reader(plan):
+    '''
+    Generates a function of parameter_values equivalent to read_plan(plan,
+    parameter_values)
+
+    The plan is written out as a single python expression, so reading it
+    takes one call with no recursion or checks of node tags.
+    '''
+    namespace = {}
+
+    def constant(value):
+        if (value is None or type(value) in (bool, int, str) or
+                (type(value) is float and np.isfinite(value))):
+            return repr(value)
+        name = '_c{}'.format(len(namespace))
+        namespace[name] = value
+        return name
+
+    def expression(plan):
+        tag, payload = plan
+        if tag == _PARAMETER:
+            return 'p[{}]'.format(payload)
+        elif tag == _DICT:
+            keys, values = payload
+            items = ['{}: {}'.format(constant(key), expression(val))
+                     for key, val in zip(keys, values)]
+            return '{' + ', '.join(items) + '}'
+        elif tag == _CALL:
+            func, args = payload
+            args = [expression(arg) for arg in args]
+            return '{}({})'.format(constant(func), ', '.join(args))
+        elif tag == _LIST:
+            return '[' + ', '.join(expression(item) for item in payload) + ']'
+        else:
+            return constant(payload)
+
+    return eval('lambda p: ' + expression(plan), namespace)
+
+
+def _plan_has_parameters(plan):
+    tag, payload = plan
+    if tag == _PARAMETER:
+        return True
+    elif tag == _DICT:
+        return any(_plan_has_parameters(val) for val in payload[1])
+    elif tag == _CALL:
+        return any(_plan_has_parameters(arg) for arg in payload[1])
+    elif tag == _LIST:
+        return any(_plan_has_parameters(item) for item in payload)
+    else:
+        return False
+
+
 def edit_map_indices(map_entry, indices):
     '''
     Adjusts a map to account for ties between parameters
@@ -107,20 +296,37 @@ def edit_map_indices(map_entry, indices):
     indices: listlike
         indices of parameters to be tied
     '''
-    if isinstance(map_entry, list):
-        return [edit_map_indices(item, indices) for item in map_entry]
-    elif isinstance(map_entry, str) and map_entry[:11] == '_parameter_':
-        old_index = int(map_entry.split("_")[-1])
-        if old_index in indices:
-            new_index = indices[0]
-        elif old_index < indices[0]:
-            new_index = old_index
+    return _remap_indices(map_entry, _tied_index_table(indices),
+                          len(indices) - 1)
+
+
+def _tied_index_table(indices):
+    '''
+    New index of every parameter up to the last of the (sorted) indices once
+    they are tied together. Later parameters all move down by
+    len(indices) - 1.
+    '''
+    table = []
+    n_tied_below = 0
+    for old_index in range(indices[-1] + 1):
+        if old_index == indices[n_tied_below]:
+            table.append(indices[0])
+            n_tied_below += 1
         else:
-            shift = (np.array(indices) < old_index).sum() - 1
-            new_index = old_index - shift
-        return '_parameter_{}'.format(new_index)
-    else:
+            table.append(old_index - max(n_tied_below - 1, 0))
+    return table
+
+
+def _remap_indices(map_entry, table, shift):
+    if isinstance(map_entry, list):
+        return [_remap_indices(item, table, shift) for item in map_entry]
+    old_index = _parameter_index(map_entry)
+    if old_index is None:
         return map_entry
+    elif old_index < len(table):
+        return _ParamRef(table[old_index])
+    else:
+        return _ParamRef(old_index - shift)
 
 
 class Model(HoloPyObject):
@@ -129,6 +335,27 @@ class Model(HoloPyObject):
     Compute probabilities that observed data could be explained by a set of
     scatterer and observation parameters.
     """
+    # {id(prior): index in self._parameters}, for finding ties
+    _param_id_to_index = None
+    # (self._parameter_names, set of them), and {name: next suffix} for
+    # repeated names
+    _name_set = None
+    _name_counts = None
+    # (self._parameters, its length, *the priors split by _prior_terms)
+    _prior_terms_cache = None
+    # (pars, values of pars, {name: value computed from pars})
+    _eval_cache = None
+    # {number of data points: (noise_sd, log-likelihood normalization)}
+    _normalization_cache = None
+    # (self._parameter_names, self._parameters, dict of them by name)
+    _parameters_dict_cache = None
+    # (self._maps['optics'], {optics key: generated reader})
+    _optics_readers_cache = None
+    # (self.constraints, its length, self._maps['scatterer'], check functions)
+    _constraint_checks_cache = None
+    # {map key: (self._maps[key], compiled plan, generated reader)}
+    _compiled_maps = None
+
     def __init__(self, scatterer, noise_sd=None, medium_index=None,
                  illum_wavelen=None, illum_polarization=None, theory='auto',
                  constraints=[]):
@@ -156,7 +383,7 @@ class Model(HoloPyObject):
             mapped = self._map_complex(parameter, name)
         elif isinstance(parameter, Prior):
             index = self._get_parameter_index(parameter, name)
-            mapped = '_parameter_{}'.format(index)
+            mapped = _ParamRef(index)
         else:
             mapped = parameter
         return mapped
@@ -192,30 +419,58 @@ class Model(HoloPyObject):
             index = len(self._parameters)
             self._add_parameter(parameter, name)
         else:
+            names = self._parameter_name_set()
             shared_name = self._parameter_names[index].split(':', 1)[-1]
-            if shared_name not in self._parameter_names:
+            if shared_name not in names:
+                names.discard(self._parameter_names[index])
+                names.add(shared_name)
                 self._parameter_names[index] = shared_name
+                self._parameters_dict_cache = None
         return index
 
     def _check_for_ties(self, parameter):
-        for index, existing in enumerate(self._parameters):
-            # can't simply check parameter in self._parameters because
-            # then two priors defined separately, but identically will
-            # match whereas this way they are counted as separate objects.
-            if existing is parameter:
-                return index
+        # can't simply check parameter in self._parameters because
+        # then two priors defined separately, but identically will
+        # match whereas this way they are counted as separate objects.
+        indices = self._param_id_to_index
+        if indices is None or len(indices) != len(self._parameters):
+            indices = self._param_id_to_index = {
+                id(existing): index
+                for index, existing in enumerate(self._parameters)}
+        index = indices.get(id(parameter))
+        if index is not None and self._parameters[index] is parameter:
+            return index
 
     def _add_parameter(self, parameter, name):
+        if self._param_id_to_index is not None:
+            self._param_id_to_index[id(parameter)] = len(self._parameters)
         self._parameters.append(parameter)
         if parameter.name is not None:
             name = parameter.name
-        if name in self._parameter_names:
-            name += '_0'
-        while name in self._parameter_names:
-            counter, reversename = name[::-1].split("_", 1)
-            name = reversename[::-1] + "_" + str(int(counter[::-1]) + 1)
+        names = self._parameter_name_set()
+        if name in names:
+            # number repeated names name_0, name_1, ..., starting after the
+            # last suffix handed out for this name
+            if self._name_counts is None:
+                self._name_counts = {}
+            suffix = self._name_counts.get(name, 0)
+            while '{}_{}'.format(name, suffix) in names:
+                suffix += 1
+            self._name_counts[name] = suffix + 1
+            name = '{}_{}'.format(name, suffix)
+        names.add(name)
         self._parameter_names.append(name)
 
+    def _parameter_name_set(self):
+        cached = self._name_set
+        if (cached is None or cached[0] is not self._parameter_names or
+                len(cached[1]) != len(self._parameter_names)):
+            # the names were replaced, so the suffixes handed out are stale
+            self._name_counts = None
+            cached = (self._parameter_names, set(self._parameter_names))
+            self._name_set = cached
+        return cached[1]
+
     def add_tie(self, parameters_to_tie, new_name=None):
         """
         Defines new ties between model parameters
@@ -228,13 +483,14 @@ class Model(HoloPyObject):
             the name for the new tied parameter
         """
         indices = []
+        parameters = self._parameters_dict()
         for par in parameters_to_tie:
-            if par not in self._parameter_names:
+            if par not in parameters:
                 msg = ("Cannot tie parameter {}. It is not present in "
                        "parameters {}").format(par, self._parameter_names)
                 raise ValueError(msg)
-            first_value = self.parameters[parameters_to_tie[0]].renamed(None)
-            if not self.parameters[par].renamed(None) == first_value:
+            first_value = parameters[parameters_to_tie[0]].renamed(None)
+            if not parameters[par].renamed(None) == first_value:
                 msg = "Cannot tie unequal parameters {} and {}".format(
                         par, parameters_to_tie[0])
                 raise ValueError(msg)
@@ -245,8 +501,14 @@ class Model(HoloPyObject):
             del(self._parameter_names[index])
         if new_name is not None:
             self._parameter_names[indices[0]] = new_name
-        self._maps = {key: edit_map_indices(val, indices)
+        table = _tied_index_table(indices)
+        self._maps = {key: _remap_indices(val, table, len(indices) - 1)
                       for key, val in self._maps.items()}
+        self._param_id_to_index = None
+        self._name_set = None
+        self._name_counts = None
+        self._eval_cache = None
+        self._parameters_dict_cache = None
 
     def _iteritems(self):
         keys = ['scatterer', 'theory', '_parameters',
@@ -293,8 +555,22 @@ class Model(HoloPyObject):
         """
         dictionary of the model's parameters
         """
-        return {name: par for name, par in zip(self._parameter_names,
-                                               self._parameters)}
+        return dict(self._parameters_dict())
+
+    def _parameters_dict(self):
+        """
+        The dict of self.parameters, kept between calls until the parameters
+        change. Internal use only: callers must not modify it.
+        """
+        cached = self._parameters_dict_cache
+        if (cached is None or cached[0] is not self._parameter_names or
+                cached[1] is not self._parameters or
+                len(cached[2]) != len(self._parameters)):
+            parameters = {name: par for name, par in
+                          zip(self._parameter_names, self._parameters)}
+            cached = (self._parameter_names, self._parameters, parameters)
+            self._parameters_dict_cache = cached
+        return cached[2]
 
     @property
     def initial_guess(self):
@@ -344,9 +620,87 @@ class Model(HoloPyObject):
         """
         Internal function taking pars as a list only
         """
-        scatterer_parameters = read_map(self._maps['scatterer'], pars)
+        scatterer_parameters = self._read_map('scatterer', pars)
         return self._dummy_scatterer.from_parameters(scatterer_parameters)
 
+    def _cached_scatterer(self, pars):
+        """
+        Scatterer for pars, built once for all the steps of evaluating the
+        posterior at pars, e.g. shared between _lnprior and _forward
+        """
+        cache = self._evaluation_cache(pars)
+        if 'scatterer' not in cache:
+            cache['scatterer'] = self._scatterer_from_parameters(pars)
+        return cache['scatterer']
+
+    def _compiled_entry(self, key):
+        """
+        (map, compiled plan, generated reader) of self._maps[key], made on
+        first use and again whenever the map is replaced.
+        """
+        map_entry = self._maps[key]
+        compiled = self._compiled_maps
+        if compiled is None:
+            compiled = self._compiled_maps = {}
+        if key not in compiled or compiled[key][0] is not map_entry:
+            plan = compile_map(map_entry)
+            compiled[key] = (map_entry, plan, plan_reader(plan))
+        return compiled[key]
+
+    def _compiled_map(self, key):
+        """
+        Compiled plan of self._maps[key]
+        """
+        return self._compiled_entry(key)[1]
+
+    def _read_map(self, key, pars):
+        """
+        Reads self._maps[key] with pars through its generated reader
+        """
+        return self._compiled_entry(key)[2](pars)
+
+    def __getstate__(self):
+        # generated readers can't be pickled, they are remade on first use
+        state = self.__dict__.copy()
+        state.pop('_compiled_maps', None)
+        state.pop('_optics_readers_cache', None)
+        state.pop('_constraint_checks_cache', None)
+        return state
+
+    def _evaluation_cache(self, pars):
+        """
+        Dictionary for values computed from pars, shared between calls with
+        the same pars, like those made within one lnposterior evaluation.
+
+        It is matched on the identity of pars, and also on its values so
+        a list edited in place between calls is not mistaken for the last.
+        """
+        values = tuple(pars)
+        cache = self._eval_cache
+        if cache is None or cache[0] is not pars or cache[1] != values:
+            cache = self._eval_cache = (pars, values, {})
+        return cache[2]
+
+    def _optics_readers(self):
+        """
+        {optics key: generated reader} for each entry of self._maps['optics'],
+        so single optics values are read without building the optics dict.
+        """
+        optics_map = self._maps['optics']
+        cached = self._optics_readers_cache
+        if cached is None or cached[0] is not optics_map:
+            tag, payload = self._compiled_map('optics')
+            if tag == _DICT:
+                readers = {key: plan_reader(plan)
+                           for key, plan in zip(*payload)}
+            else:
+                read_optics = self._compiled_entry('optics')[2]
+                readers = {
+                    key: lambda pars, key=key: read_optics(pars).get(key)
+                    for key in OPTICS_KEYS}
+            cached = self._optics_readers_cache = (optics_map, readers)
+        return cached[1]
+
     def ensure_parameters_are_listlike(self, pars):
         if isinstance(pars, dict):
             pars = [pars[name] for name in self._parameter_names]
@@ -361,14 +715,13 @@ class Model(HoloPyObject):
         pars: list
             values to create optics. Order should match model._parameters
         """
-        mapped_optics = read_map(self._maps['optics'], pars)
+        readers = self._optics_readers()
 
         def find_parameter(key):
-            if key in mapped_optics and mapped_optics[key] is not None:
-                val = mapped_optics[key]
-            elif hasattr(schema, key) and getattr(schema, key) is not None:
-                val = getattr(schema, key)
-            else:
+            val = readers[key](pars) if key in readers else None
+            if val is None:
+                val = getattr(schema, key, None)
+            if val is None:
                 raise MissingParameter(key)
             return val
         return {key: find_parameter(key) for key in OPTICS_KEYS[:-1]}
@@ -382,13 +735,12 @@ class Model(HoloPyObject):
         pars: list
             values to create noise_sd. Order should match model._parameters
         """
-        optics_map = read_map(self._maps['optics'], pars)
-        if 'noise_sd' in optics_map and optics_map['noise_sd'] is not None:
-            val = optics_map['noise_sd']
-        elif hasattr(schema, 'noise_sd'):
+        readers = self._optics_readers()
+        val = readers['noise_sd'](pars) if 'noise_sd' in readers else None
+        if val is None:
+            if not hasattr(schema, 'noise_sd'):
+                raise MissingParameter('noise_sd')
             val = schema.noise_sd
-        else:
-            raise MissingParameter('noise_sd')
         if val is None:
             if np.all([isinstance(par, Uniform) for par in self._parameters]):
                 val = 1
@@ -421,15 +773,61 @@ class Model(HoloPyObject):
         """
         if 'scatterer' in self._maps:
             try:
-                par_scat = self._scatterer_from_parameters(pars)
+                par_scat = self._cached_scatterer(pars)
             except InvalidScatterer:
                 return -np.inf
 
-        for constraint in self.constraints:
-            if not constraint.check(par_scat):
+        for check in self._constraint_checks():
+            if not check(par_scat):
+                return -np.inf
+        bounds, uniform_lnprob, others = self._prior_terms()
+        for index, lower_bound, upper_bound in bounds:
+            val = pars[index]
+            if val < lower_bound or val > upper_bound:
                 return -np.inf
-        return sum([p.lnprob(val) for p, val in
-                    zip(self._parameters, pars)])
+        if not others:
+            return uniform_lnprob
+        return uniform_lnprob + sum([p.lnprob(pars[index])
+                                     for index, p in others])
+
+    def _constraint_checks(self):
+        """
+        Check functions of self.constraints, specialized to this model by the
+        prepare method of constraints that have one.
+        """
+        scatterer_map = self._maps.get('scatterer')
+        cached = self._constraint_checks_cache
+        if (cached is None or cached[0] is not self.constraints or
+                cached[1] != len(self.constraints) or
+                cached[2] is not scatterer_map):
+            checks = [constraint.prepare(self)
+                      if hasattr(constraint, 'prepare') else constraint.check
+                      for constraint in self.constraints]
+            cached = (self.constraints, len(self.constraints),
+                      scatterer_map, checks)
+            self._constraint_checks_cache = cached
+        return cached[3]
+
+    def _prior_terms(self):
+        """
+        Splits the priors for _lnprior into the (index, lower_bound,
+        upper_bound) of each Uniform prior, the sum of their log-probabilities
+        within bounds, which is constant, and (index, prior) of all others.
+        """
+        cached = self._prior_terms_cache
+        if (cached is None or cached[0] is not self._parameters or
+                cached[1] != len(self._parameters)):
+            bounds, others, uniform_lnprob = [], [], 0
+            for index, par in enumerate(self._parameters):
+                if type(par) is Uniform:
+                    bounds.append((index, par.lower_bound, par.upper_bound))
+                    uniform_lnprob += par._lnprob
+                else:
+                    others.append((index, par))
+            cached = (self._parameters, len(self._parameters),
+                      bounds, uniform_lnprob, others)
+            self._prior_terms_cache = cached
+        return cached[2:]
 
     def lnposterior(self, pars, data, pixels=None):
         """
@@ -477,6 +875,12 @@ class Model(HoloPyObject):
 
     def _residuals(self, pars, data, noise):
         forward_model = self._forward(pars, data)
+        if (isinstance(forward_model, xr.DataArray) and
+                forward_model.dims == data.dims and
+                forward_model.shape == data.shape and
+                not isinstance(noise, xr.DataArray)):
+            # laid out like data, so there are no coordinates to align
+            return (forward_model.values - data.values) / noise
         return ((forward_model - data) / noise).values
 
     def lnlike(self, pars, data):
@@ -498,17 +902,72 @@ class Model(HoloPyObject):
         pars = self.ensure_parameters_are_listlike(pars)
         return self._lnlike(pars, data)
 
+    def lnlike_batch(self, pars_batch, data):
+        """
+        Compute the log-likelihood of data for several sets of pars at once,
+        such as the positions of all walkers in an ensemble
+
+        Parameters
+        -----------
+        pars_batch: list or 2D array
+            one entry per set of parameters, each either a list of values in
+            the order of self._parameters or a dict keyed by self.parameters
+        data: xarray
+            The data to compute likelihood against
+
+        Returns
+        --------
+        lnlike: ndarray
+            log-likelihood of each entry of pars_batch
+        """
+        pars_batch = [self.ensure_parameters_are_listlike(pars)
+                      for pars in pars_batch]
+        residuals = np.empty((len(pars_batch), data.size))
+        normalization = np.empty(len(pars_batch))
+        for row, pars in enumerate(pars_batch):
+            noise_sd = self._find_noise(pars, data)
+            residuals[row] = np.ravel(self._residuals(pars, data, noise_sd))
+            normalization[row] = self._lnlike_normalization(noise_sd,
+                                                            data.size)
+        # sums the squares of each row without allocating them
+        return normalization - 0.5 * np.einsum('ij,ij->i',
+                                               residuals, residuals)
+
     def _lnlike(self, pars, data):
         """
         Internal function taking pars as a list only
         """
         noise_sd = self._find_noise(pars, data)
-        N = data.size
-        log_likelihood = ensure_scalar(
-            -N/2 * np.log(2 * np.pi) -
-            N * np.mean(np.log(ensure_array(noise_sd))) -
-            0.5 * (self._residuals(pars, data, noise_sd)**2).sum())
-        return log_likelihood
+        # a dot product sums the squares without allocating them
+        residuals = np.ravel(self._residuals(pars, data, noise_sd))
+        return (self._lnlike_normalization(noise_sd, data.size) -
+                0.5 * float(np.dot(residuals, residuals)))
+
+    def _lnlike_normalization(self, noise_sd, N):
+        """
+        Terms of the log-likelihood of N data points that do not depend on
+        the residuals. These are stored for reuse unless noise_sd is a model
+        parameter.
+        """
+        static = not self._noise_is_parameterized()
+        if static:
+            if self._normalization_cache is None:
+                self._normalization_cache = {}
+            cached = self._normalization_cache.get(N)
+            if cached is not None and cached[0] is noise_sd:
+                return cached[1]
+        normalization = (-N/2 * np.log(2 * np.pi) -
+                         N * float(np.mean(np.log(noise_sd))))
+        if static:
+            self._normalization_cache[N] = (noise_sd, normalization)
+        return normalization
+
+    def _noise_is_parameterized(self):
+        tag, payload = self._compiled_map('optics')
+        if tag == _DICT and 'noise_sd' in payload[0]:
+            keys, values = payload
+            return _plan_has_parameters(values[keys.index('noise_sd')])
+        return False
 
     def fit(self, data, strategy=None):
         from holopy.fitting import fit_warning
@@ -535,7 +994,29 @@ class LimitOverlaps(HoloPyObject):
         self.fraction = fraction
 
     def check(self, s):
-        return s.largest_overlap() <= ((np.min(s.r) * 2) * self.fraction)
+        return s.largest_overlap() <= self._threshold(s)
+
+    def _threshold(self, s):
+        return (np.min(s.r) * 2) * self.fraction
+
+    def prepare(self, model):
+        """
+        Returns a check for scatterers of model. If no sphere radius of
+        model depends on a parameter, the largest allowed overlap is found
+        on the first check and reused afterwards.
+        """
+        tag, payload = model._compiled_map('scatterer')
+        if tag != _DICT or any(_plan_has_parameters(plan)
+                               for key, plan in zip(*payload)
+                               if key.split(':')[-1] == 'r'):
+            return self.check
+        threshold = []
+
+        def check(s):
+            if not threshold:
+                threshold.append(self._threshold(s))
+            return s.largest_overlap() <= threshold[0]
+        return check
 
 
 class AlphaModel(Model):
@@ -551,7 +1032,7 @@ class AlphaModel(Model):
 
     @property
     def alpha(self):
-        return read_map(self._maps['model'], self._parameters)['alpha']
+        return self._read_map('model', self._parameters)['alpha']
 
     def _forward(self, pars, detector):
         """
@@ -567,9 +1048,9 @@ class AlphaModel(Model):
             dimensions of the resulting hologram. Metadata taken from
             detector if not given explicitly when instantiating self.
         """
-        alpha = read_map(self._maps['model'], pars)['alpha']
+        alpha = self._read_map('model', pars)['alpha']
         optics = self._find_optics(pars, detector)
-        scatterer = self._scatterer_from_parameters(pars)
+        scatterer = self._cached_scatterer(pars)
         try:
             return calc_holo(detector, scatterer, theory=self.theory,
                              scaling=alpha, **optics)
@@ -610,7 +1091,7 @@ class ExactModel(Model):
             detector if not given explicitly when instantiating self.
         """
         optics = self._find_optics(pars, detector)
-        scatterer = self._scatterer_from_parameters(pars)
+        scatterer = self._cached_scatterer(pars)
         try:
             return self.calc_func(detector, scatterer, theory=self.theory, **optics)
         except (MultisphereFailure, InvalidScatterer):
@@ -621,6 +1102,9 @@ class PerfectLensModel(Model):
     """
     Model of hologram image formation through a high-NA objective.
     """
+    # (self._maps['theory'], MieLens theory) when lens_angle is fixed
+    _lens_theory_cache = None
+
     def __init__(self, scatterer, alpha=1.0, lens_angle=1.0, noise_sd=None,
                  medium_index=None, illum_wavelen=None, theory='auto',
                  illum_polarization=None, constraints=[]):
@@ -631,11 +1115,27 @@ class PerfectLensModel(Model):
 
     @property
     def alpha(self):
-        return read_map(self._maps['model'], self._parameters)['alpha']
+        return self._read_map('model', self._parameters)['alpha']
 
     @property
     def lens_angle(self):
-        return read_map(self._maps['theory'], self._parameters)['lens_angle']
+        return self._read_map('theory', self._parameters)['lens_angle']
+
+    def _lens_theory(self, pars):
+        """
+        MieLens theory for pars, made once and reused while lens_angle does
+        not depend on any parameter.
+        """
+        theory_map = self._maps['theory']
+        cached = self._lens_theory_cache
+        if cached is not None and cached[0] is theory_map:
+            return cached[1]
+        theory_kwargs = self._read_map('theory', pars)
+        # FIXME would be nice to have access to the interpolator kwargs
+        theory = MieLens(**theory_kwargs)
+        if not _plan_has_parameters(self._compiled_map('theory')):
+            self._lens_theory_cache = (theory_map, theory)
+        return theory
 
     def _forward(self, pars, detector):
         """
@@ -650,12 +1150,10 @@ class PerfectLensModel(Model):
             dimensions of the resulting hologram. Metadata taken from
             detector if not given explicitly when instantiating self.
         """
-        alpha = read_map(self._maps['model'], pars)['alpha']
+        alpha = self._read_map('model', pars)['alpha']
         optics_kwargs = self._find_optics(pars, detector)
-        scatterer = self._scatterer_from_parameters(pars)
-        theory_kwargs = read_map(self._maps['theory'], pars)
-        # FIXME would be nice to have access to the interpolator kwargs
-        theory = MieLens(**theory_kwargs)
+        scatterer = self._cached_scatterer(pars)
+        theory = self._lens_theory(pars)
         try:
             return calc_holo(detector, scatterer, theory=theory,
                              scaling=alpha, **optics_kwargs)
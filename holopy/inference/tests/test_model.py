@@ -19,6 +19,7 @@
 
 import unittest
 import tempfile
+import pickle
 import warnings
 
 import yaml
@@ -38,8 +39,9 @@ from holopy.inference import (prior, AlphaModel, ExactModel,
                               NmpfitStrategy, EmceeStrategy,
                               available_fit_strategies,
                               available_sampling_strategies)
-from holopy.inference.model import (Model, PerfectLensModel,
-                                    make_xarray, make_complex, read_map)
+from holopy.inference.model import (Model, PerfectLensModel, LimitOverlaps,
+                                    make_xarray, make_complex, read_map,
+                                    compile_map, read_plan, plan_reader)
 from holopy.inference.tests.common import SimpleModel
 from holopy.scattering.tests.common import (
     xschema_lens, sphere as SPHERE_IN_METERS)
@@ -129,6 +131,36 @@ class TestModel(unittest.TestCase):
         expected = Sphere(n=1.6, r=0.8)
         self.assertEqual(model._scatterer_from_parameters(pars), expected)
 
+    @attr('fast')
+    def test_scatterer_shared_within_evaluation(self):
+        sphere = Sphere(n=prior.Uniform(1, 2), r=prior.Uniform(0, 1))
+        model = AlphaModel(sphere)
+        pars = [1.6, 0.8]
+        scatterer = model._cached_scatterer(pars)
+        self.assertIs(model._cached_scatterer(pars), scatterer)
+        pars[1] = 0.7
+        self.assertEqual(model._cached_scatterer(pars), Sphere(n=1.6, r=0.7))
+
+    @attr('fast')
+    def test_lnprior_mixes_uniform_and_other_priors(self):
+        sphere = Sphere(n=prior.Uniform(1, 2), r=prior.Gaussian(0.5, 0.1),
+                        center=[10, 10, prior.Uniform(5, 15)])
+        model = AlphaModel(sphere)
+        pars = [1.6, 0.45, 12]
+        expected = sum([p.lnprob(val)
+                        for p, val in zip(model._parameters, pars)])
+        self.assertAlmostEqual(model.lnprior(pars), expected)
+        self.assertEqual(model.lnprior([1.6, 0.45, 16]), -np.inf)
+
+    @attr('fast')
+    def test_lnprior_of_uniform_priors_is_constant_within_bounds(self):
+        sphere = Sphere(n=prior.Uniform(1, 2), r=prior.Uniform(0.2, 0.7))
+        model = AlphaModel(sphere)
+        expected = -np.log(1) - np.log(0.5)
+        self.assertAlmostEqual(model.lnprior([1.2, 0.3]), expected)
+        self.assertAlmostEqual(model.lnprior([1.9, 0.6]), expected)
+        self.assertEqual(model.lnprior([1.9, 0.8]), -np.inf)
+
     @attr('fast')
     def test_initial_guess(self):
         sphere = Sphere(n=prior.Uniform(1, 2),
@@ -166,6 +198,28 @@ class TestModel(unittest.TestCase):
         self.assertEqual(post_model._parameter_names, ['b', 'c'])
         self.assertEqual(post_model._parameters[0].name, 'a')
 
+    @attr('fast')
+    def test_parameters_follow_ties_and_renames(self):
+        sphere = Sphere(n=prior.Uniform(1, 2), r=prior.Uniform(0, 1),
+                        center=[prior.Uniform(0, 1), 5, 10])
+        model = AlphaModel(sphere)
+        self.assertEqual(set(model.parameters), {'n', 'r', 'center.0'})
+        model.add_tie(['r', 'center.0'], new_name='size')
+        self.assertEqual(model.parameters, {'n': prior.Uniform(1, 2),
+                                            'size': prior.Uniform(0, 1)})
+        model._parameter_names = ['a', 'b']
+        self.assertEqual(set(model.parameters), {'a', 'b'})
+
+    @attr('fast')
+    def test_editing_parameters_dict_leaves_model_unchanged(self):
+        sphere = Sphere(n=prior.Uniform(1, 2), r=prior.Uniform(0, 1),
+                        center=[prior.Uniform(0, 1), 5, 10])
+        model = AlphaModel(sphere)
+        model.parameters.pop('r')
+        self.assertIn('r', model.parameters)
+        model.add_tie(['r', 'center.0'])
+        self.assertEqual(set(model.parameters), {'n', 'r'})
+
     @attr('fast')
     def test_ensure_parameters_are_listlike(self):
         sphere = Sphere(r=prior.Uniform(0, 1), n=prior.Uniform(1, 2))
@@ -194,6 +248,14 @@ class TestParameterMapping(unittest.TestCase):
         expected = '_parameter_{}'.format(position)
         self.assertEqual(parameter_map, expected)
 
+    @attr("fast")
+    def test_map_prior_saves_as_placeholder_string(self):
+        model = SimpleModel()
+        parameter_map = model._convert_to_map(prior.Uniform(0, 1))
+        reloaded = yaml.safe_load(yaml.dump(parameter_map))
+        self.assertEqual(reloaded, parameter_map)
+        self.assertIs(type(reloaded), str)
+
     @attr("fast")
     def test_mapping_adds_to_model(self):
         model = SimpleModel()
@@ -335,6 +397,53 @@ class TestParameterMapping(unittest.TestCase):
         expected = {'r': [0.5, 0.7], 'n': n_expected, 'center': [10, 20, 30]}
         self.assertEqual(read_map(parameter_map, placeholders), expected)
 
+    @attr("fast")
+    def test_read_compiled_composite_map(self):
+        n_map = [dict, [[['red', [make_complex, [1.5, "_parameter_2"]]],
+                         ['green', [make_complex, [1.7, 0.03]]]]]]
+        parameter_map = [dict, [[['r', ["_parameter_0", "_parameter_1"]],
+                                 ['n', n_map],
+                                 ['center', [10, 20, "_parameter_3"]]]]]
+        placeholders = [0.5, 0.7, 0.01, 30]
+        plan = compile_map(parameter_map)
+        self.assertEqual(read_plan(plan, placeholders),
+                         read_map(parameter_map, placeholders))
+
+    @attr("fast")
+    def test_plan_reader_matches_read_plan(self):
+        parameter_map = [dict, [[['r', ["_parameter_0", np.nan, None]],
+                                 ['n', [make_complex, [1.5, "_parameter_1"]]],
+                                 [3, [make_xarray, ['c', ['a'], [0.5]]]]]]]
+        plan = compile_map(parameter_map)
+        values = [0.5, 0.01]
+        xr.testing.assert_equal(plan_reader(plan)(values)[3],
+                                read_plan(plan, values)[3])
+        self.assertEqual(plan_reader(plan)(values)['n'], complex(1.5, 0.01))
+        np.testing.assert_equal(plan_reader(plan)(values)['r'],
+                                read_plan(plan, values)['r'])
+
+    @attr("fast")
+    def test_model_pickles_after_reading_maps(self):
+        model = AlphaModel(Sphere(n=prior.Uniform(1, 2), r=0.5),
+                           medium_index=prior.Uniform(1.3, 1.4))
+        schema = detector_grid(2, 1)
+        schema = update_metadata(schema, illum_wavelen=0.66,
+                                 illum_polarization=(1, 0))
+        model.scatterer_from_parameters([1.5, 1.33])
+        optics = model._find_optics([1.5, 1.33], schema)
+        reloaded = pickle.loads(pickle.dumps(model))
+        self.assertEqual(reloaded.scatterer_from_parameters([1.5, 1.33]),
+                         Sphere(n=1.5, r=0.5))
+        self.assertEqual(reloaded._find_optics([1.5, 1.33], schema), optics)
+
+    @attr("fast")
+    def test_compiled_map_builds_new_containers(self):
+        parameter_map = [dict, [[['center', [10, 20, 30]]]]]
+        plan = compile_map(parameter_map)
+        first = read_plan(plan, [])
+        first['center'].append(40)
+        self.assertEqual(read_plan(plan, []), {'center': [10, 20, 30]})
+
     @attr("fast")
     def test_make_xarray_1D(self):
         values = [1, 2, 3, 4, 5]
@@ -356,6 +465,20 @@ class TestParameterMapping(unittest.TestCase):
         expected = xr.concat([slice1, slice2], dim=join_dim)
         xr.testing.assert_equal(constructed, expected)
 
+    @attr("fast")
+    def test_compiled_xarray_map_matches_read_map(self):
+        model = SimpleModel()
+        parameter = xr.DataArray(np.zeros((2, 3)),
+                                 coords=[[10, 20], ['a', 'b', 'c']],
+                                 dims=('tens', 'letters')).astype('object')
+        parameter[-1, -1] = prior.Uniform(0, 1)
+        parameter_map = model._convert_to_map(parameter)
+        plan = compile_map(parameter_map)
+        for values in [[0, 0, 0.5], [0, 0, 0.7]]:
+            expected = read_map(parameter_map, values)
+            xr.testing.assert_identical(read_plan(plan, values), expected)
+            xr.testing.assert_identical(plan_reader(plan)(values), expected)
+
 
 class TestParameterTying(unittest.TestCase):
     @attr('fast')
@@ -437,6 +560,26 @@ class TestParameterTying(unittest.TestCase):
         expected = ['dummy', 'dummy_0', 'dummy_1', 'z']
         self.assertEqual(model._parameter_names, expected)
 
+    @attr('fast')
+    def test_repeated_name_skips_taken_suffix(self):
+        sphere = Sphere(n=prior.Uniform(1, 2, name='dummy_0'),
+                        r=prior.Uniform(1, 2, name='dummy'),
+                        center=[prior.Uniform(0, 1, name='dummy'), 0, 0])
+        model = AlphaModel(sphere)
+        expected = ['dummy_0', 'dummy', 'dummy_1']
+        self.assertEqual(model._parameter_names, expected)
+
+    @attr('fast')
+    def test_repeated_name_after_names_replaced(self):
+        sphere = Sphere(n=prior.Uniform(1, 2, name='dummy'),
+                        r=prior.Uniform(1, 2, name='dummy'), center=[0, 0, 0])
+        model = AlphaModel(sphere)
+        # as from_yaml does, with a list of the same length
+        model._parameter_names = ['n', 'r']
+        model._convert_to_map(prior.Uniform(0, 1, name='n'))
+        expected = ['n', 'r', 'n_0']
+        self.assertEqual(model._parameter_names, expected)
+
     @attr('fast')
     def test_add_missing_tie_fails(self):
         sphere = Sphere(n=prior.Uniform(1, 2), r=0.5, center=[10, 10, 10])
@@ -513,6 +656,29 @@ class TestParameterTying(unittest.TestCase):
         self.assertEqual(model._parameter_names, expected_names)
 
 
+class TestLimitOverlaps(unittest.TestCase):
+    @attr('fast')
+    def test_prepared_check_matches_check(self):
+        spheres = Spheres([
+            Sphere(n=1.5, r=0.5, center=[prior.Uniform(0, 2), 0, 10]),
+            Sphere(n=1.5, r=0.5, center=[0, 0, 10])])
+        constraint = LimitOverlaps(0.1)
+        model = AlphaModel(spheres, constraints=constraint)
+        check = constraint.prepare(model)
+        for x in [0.5, 0.95, 1.5]:
+            scatterer = model.scatterer_from_parameters([x])
+            self.assertEqual(check(scatterer), constraint.check(scatterer))
+
+    @attr('fast')
+    def test_radius_prior_keeps_plain_check(self):
+        spheres = Spheres([
+            Sphere(n=1.5, r=prior.Uniform(0.4, 0.6), center=[1, 0, 10]),
+            Sphere(n=1.5, r=0.5, center=[0, 0, 10])])
+        constraint = LimitOverlaps(0.1)
+        model = AlphaModel(spheres, constraints=constraint)
+        self.assertEqual(constraint.prepare(model), constraint.check)
+
+
 class TestFindOptics(unittest.TestCase):
     @attr('fast')
     def test_reads_noise_map(self):
@@ -567,6 +733,17 @@ class TestFindOptics(unittest.TestCase):
                     'illum_polarization': [1, 1]}
         self.assertEqual(found_optics, expected)
 
+    @attr('fast')
+    def test_optics_follow_pars_edited_in_place(self):
+        model = AlphaModel(Sphere(), medium_index=prior.Uniform(1, 2),
+                           illum_wavelen=0.66, illum_polarization=[1, 0],
+                           noise_sd=prior.Uniform(0, 1))
+        pars = [1.5, 0.1]
+        self.assertEqual(model._find_optics(pars, None)['medium_index'], 1.5)
+        pars[0] = 1.6
+        self.assertEqual(model._find_optics(pars, None)['medium_index'], 1.6)
+        self.assertEqual(model._find_noise(pars, None), 0.1)
+
     @attr('fast')
     def test_optics_from_schema(self):
         model = AlphaModel(Sphere(), medium_index=prior.Uniform(1, 2))
@@ -597,6 +774,47 @@ class TestFindOptics(unittest.TestCase):
         self.assertRaises(MissingParameter, model._find_optics, [], schema)
 
 
+class TestLikelihoodNormalization(unittest.TestCase):
+    @attr('fast')
+    def test_static_noise_normalization_is_stored(self):
+        model = AlphaModel(Sphere(), noise_sd=0.1)
+        noise_sd = model._find_noise([], None)
+        normalization = model._lnlike_normalization(noise_sd, 100)
+        expected = -50 * np.log(2 * np.pi) - 100 * np.log(0.1)
+        self.assertAlmostEqual(normalization, expected)
+        self.assertEqual(model._normalization_cache[100][1], normalization)
+
+    @attr('fast')
+    def test_parameterized_noise_normalization_is_not_stored(self):
+        model = AlphaModel(Sphere(), noise_sd=prior.Uniform(0, 1))
+        for noise_sd in [0.1, 0.2]:
+            normalization = model._lnlike_normalization(noise_sd, 100)
+            expected = -50 * np.log(2 * np.pi) - 100 * np.log(noise_sd)
+            self.assertAlmostEqual(normalization, expected)
+        self.assertIsNone(model._normalization_cache)
+
+
+class TestLikelihoodEvaluation(unittest.TestCase):
+    @attr('fast')
+    def test_residuals_match_xarray_arithmetic(self):
+        model = ScaledDetectorModel(Sphere(n=prior.Uniform(1.5, 1.7)))
+        data = detector_grid(5, 0.5) + np.arange(25).reshape(1, 5, 5)
+        # forward model dims differ from, then match, those of data
+        for data in [data, data.transpose(*sorted(data.dims))]:
+            expected = ((model.forward([1.6], data) - data) / 0.1).values
+            assert_equal(model._residuals([1.6], data, 0.1), expected)
+
+    @attr('fast')
+    def test_lnlike_batch_matches_lnlike(self):
+        model = ScaledDetectorModel(Sphere(n=prior.Uniform(1.5, 1.7)),
+                                    alpha=prior.Uniform(0.5, 1),
+                                    noise_sd=0.1)
+        data = detector_grid(5, 0.5) + np.arange(25).reshape(1, 5, 5)
+        pars_batch = np.array([[1.6, 0.8], [1.55, 0.7], [1.65, 0.9]])
+        expected = [model.lnlike(pars, data) for pars in pars_batch]
+        assert_obj_close(model.lnlike_batch(pars_batch, data), expected)
+
+
 class TestAlphaModel(unittest.TestCase):
     @attr('fast')
     def test_initializable(self):
@@ -638,6 +856,21 @@ class TestPerfectLensModel(unittest.TestCase):
         model = PerfectLensModel(scatterer, lens_angle=lens_angle)
         self.assertIsInstance(model.lens_angle, prior.Prior)
 
+    @attr('fast')
+    def test_fixed_lens_angle_theory_is_reused(self):
+        sphere = Sphere(n=prior.Uniform(1.5, 1.7), r=0.5, center=[2, 2, 10])
+        model = PerfectLensModel(sphere, lens_angle=0.6)
+        theory = model._lens_theory([1.6])
+        self.assertEqual(theory.lens_angle, 0.6)
+        self.assertIs(model._lens_theory([1.55]), theory)
+
+    @attr('fast')
+    def test_lens_angle_prior_theory_follows_pars(self):
+        sphere = Sphere(n=prior.Uniform(1.5, 1.7), r=0.5, center=[2, 2, 10])
+        model = PerfectLensModel(sphere, lens_angle=prior.Uniform(0, 1.0))
+        self.assertEqual(model._lens_theory([1.6, 0.3]).lens_angle, 0.3)
+        self.assertEqual(model._lens_theory([1.6, 0.4]).lens_angle, 0.4)
+
     @attr('fast')
     def test_accepts_alpha_as_prior(self):
         scatterer = make_sphere()
@@ -682,6 +915,14 @@ def make_model_kwargs():
     return kwargs
 
 
+class ScaledDetectorModel(AlphaModel):
+    # forward model of the detector scaled by the first parameter, with dims
+    # in alphabetical order, so likelihoods can be checked without a
+    # scattering calculation
+    def _forward(self, pars, detector):
+        return (detector * pars[0]).transpose(*sorted(detector.dims))
+
+
 def take_yaml_round_trip(model):
     object_string = yaml.dump(model)
     loaded = yaml.load(object_string, Loader=holopy_object.FullLoader)
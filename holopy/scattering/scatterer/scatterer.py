@@ -139,8 +139,10 @@ class Scatterer(HoloPyObject):
         """
         # This will need to be overriden for subclasses that do anything
         # complicated with parameters
+        # only copy the values that are not given, not all of self.parameters
+        own_parameters = self._parameters
         parameters = {key: parameters[key] if key in parameters else
-                      self.parameters[key] for key in self.parameters.keys()}
+                      deepcopy(own_parameters[key]) for key in own_parameters}
         return type(self)(**parameters)
 
     def contains(self, points):
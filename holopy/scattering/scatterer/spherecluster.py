@@ -67,11 +67,18 @@ class Spheres(Scatterers):
         super().__init__(scatterers)
 
 
-        if self.overlaps and self.warn:
+        if self.warn and self.overlaps:
             warnings.warn(OverlapWarning(self, self.overlaps))
 
     @property
     def overlaps(self):
+        if len(self.scatterers) < 2:
+            return []
+        try:
+            i, j = np.nonzero(np.triu(self._pairwise_overlaps() > 0, 1))
+            return list(zip(i.tolist(), j.tolist()))
+        except (TypeError, ValueError):
+            pass
         overlaps = []
         for i, s1 in enumerate(self.scatterers):
             for j in range(i+1, len(self.scatterers)):
@@ -87,14 +94,26 @@ class Spheres(Scatterers):
         return overlaps
 
     def largest_overlap(self):
-        largest = 0
-        for i, s1 in enumerate(self.scatterers):
-            for j in range(i+1, len(self.scatterers)):
-                s2= self.scatterers[j]
-                largest = max(largest, (np.max(s1.r) + np.max(s2.r)) -
-                                       cartesian_distance(s1.center, s2.center))
-
-        return largest
+        if len(self.scatterers) < 2:
+            return 0
+        overlaps = self._pairwise_overlaps()
+        np.fill_diagonal(overlaps, -np.inf)
+        return max(0, overlaps.max())
+
+    def _pairwise_overlaps(self):
+        """
+        Array of how far each pair of spheres overlaps, as the sum of their
+        outer radii minus the distance between their centers. Raises
+        TypeError or ValueError if centers or radii are not numbers.
+        """
+        centers = np.array([s.center for s in self.scatterers], dtype=float)
+        if centers.ndim != 2:
+            raise ValueError("Sphere centers must all be coordinate triples")
+        radii = np.array([s.r if isinstance(s.r, Number) else np.max(s.r)
+                          for s in self.scatterers], dtype=float)
+        separations = centers[:, np.newaxis, :] - centers
+        distances = np.sqrt(np.einsum('ijk,ijk->ij', separations, separations))
+        return radii[:, np.newaxis] + radii - distances
 
     def add(self, scatterer):
         if not isinstance(scatterer, Sphere):
@@ -75,6 +75,17 @@ def test_Spheres_ovelap_checking():
         assert len(w) > 0
 
 
+@attr('fast')
+def test_Spheres_largest_overlap():
+    s1 = Sphere(n=1.59, r=0.5, center=[0, 0, 10])
+    s2 = Sphere(n=1.59, r=0.5, center=[0.8, 0, 10])
+    s3 = Sphere(n=[1.59, 1.4], r=[0.3, 0.6], center=[0, 2, 10])
+    sc = Spheres([s1, s2, s3], warn=False)
+    assert_equal(sc.overlaps, [(0, 1)])
+    assert_almost_equal(sc.largest_overlap(), 0.2)
+    assert_equal(Spheres([s1, s3], warn=False).largest_overlap(), 0)
+
+
 @attr("fast")
 def test_Spheres_parameters():
     s1 = Sphere(n = 1.59, r = 5e-7, center=[1e-6, -1e-6, 10e-6])